@@ -12,9 +12,19 @@ from board import board
 from action import action
 from operator import itemgetter
 from weight import weight
+from pagedweight import pagedweight
+from quantweight import quantweight
+from feature import feature
+from checkpoint import checkpoint
+import weightfile
+from bitboard import bitboard
+from collections import OrderedDict
 from array import array
+import instrument
 import random
+import time
 import sys
+import os
 class agent:
     """ base agent """
     
@@ -65,16 +75,24 @@ class random_agent(agent):
     def __init__(self, options = ""):
         super().__init__(options)
         seed = self.property("seed")
-        if seed is not None:
-            random.seed(int(seed))
+        self.seed = int(seed) if seed is not None else random.getrandbits(64) # the master seed
+        self.rng = random.Random(self.seed)
+        return
+    
+    def reseed(self, index):
+        """
+        switch to the random stream of an episode, derived from the master seed, the episode index, and the role
+        an episode plays the same regardless of which process runs it, or of the episodes before it
+        """
+        self.rng.seed(str(self.seed) + ":" + str(index) + ":" + str(self.role()))
         return
     
     def choice(self, seq):
-        target = random.choice(seq)
+        target = self.rng.choice(seq)
         return target
     
     def shuffle(self, seq):
-        random.shuffle(seq)
+        self.rng.shuffle(seq)
         return
 class weight_agent(agent):
     """ base agent for agents with weight tables """
@@ -99,15 +117,122 @@ class weight_agent(agent):
                            [ 8,  9, 12, 13],
                            [ 9, 10, 13, 14],
                            [10, 11, 14, 15]]
+        tuples = self.property("tuples") # e.g., "tuples=0,1,2,3,4,5;4,5,6,7,8,9" or "tuples=tuples.txt"
+        if tuples is not None:
+            self.tuple_list = self.parse_tuples(open(tuples).read() if os.path.isfile(tuples) else tuples)
+        self.table = list(range(len(self.tuple_list))) # the weight table of each tuple
+        if self.property("isomorphic") is not None:
+            self.isomorphic_tuples(self.tuple_list if tuples is not None else None)
+        self.set_tuples(self.tuple_list, self.table)
         load = self.property("load")
         if load is not None:
             self.load_weights(load)
         else:
-            for _ in range(len(self.tuple_list)):
-                self.net += [weight(65536)]
+            # each table is sized to its index space, the sparse tables allocate the pages on the first write
+            table = pagedweight if self.property("sparse") is not None else weight
+            for t in range(max(self.table) + 1):
+                self.net += [table(15 ** len(self.tuple_list[self.table.index(t)]))]
+        self.groups = None # the integer tables, scales, and tuples of each table for the quantized evaluation
+        if self.property("quantize") is not None:
+            self.quantize()
+        # periodic snapshots, e.g., "checkpoint=1000 delta=10 ckpt=run/weights"
+        # every 10th snapshot is a full one, the others only contain the changed pages
+        every, delta = self.property("checkpoint"), self.property("delta")
+        self.ckpt = None
+        if every is not None or self.property("resume") is not None:
+            full = 1 if delta is None else 10 if delta is True else int(delta)
+            self.ckpt = checkpoint(self.property("ckpt") or "checkpoint", int(every or 0), full)
+        return
+    
+    def set_tuples(self, tuple_list, table):
+        """ set the tuple layout, and the (tuple, index stride) pairs covering each position """
+        self.tuple_list, self.table = tuple_list, table
+        self.member = [[] for _ in range(16)]
+        for i, tup in enumerate(self.tuple_list):
+            for k, pos in enumerate(tup):
+                self.member[pos] += [(i, 15 ** (len(tup) - 1 - k))]
+        return
+    
+    def parse_tuples(self, text):
+        """
+        the tuple layout of a text, where the tuples are separated by lines or semicolons
+        and the positions are separated by commas or spaces, '#' starts a comment, e.g.,
+            0 1 2 3 4 5 # a 6-tuple
+            4 5 6 7 8 9
+        """
+        tuple_list = []
+        for line in text.replace(";", "\n").split("\n"):
+            line = line.split("#")[0].replace(",", " ").split()
+            if line:
+                tuple_list += [[int(pos) for pos in line]]
+        if not tuple_list or any([not 0 <= pos < 16 for tup in tuple_list for pos in tup]):
+            raise ValueError('invalid tuples: ' + text)
+        return tuple_list
+    
+    def isomorphic_tuples(self, shapes = None):
+        """
+        share one weight table per tuple shape across all 8 isomorphisms of the board
+        the isomorphic tuples are expanded by precomputed cell permutations
+        """
+        if shapes is None:
+            shapes = [[ 0,  1,  2,  3], # outer row
+                      [ 4,  5,  6,  7], # inner row
+                      [ 0,  1,  4,  5], # corner cube
+                      [ 1,  2,  5,  6], # edge cube
+                      [ 5,  6,  9, 10]] # center cube
+        iso = []
+        for i in range(8):
+            b = board(list(range(16)))
+            if i >= 4:
+                b.reflect_horizontal()
+            b.rotate(i)
+            iso += [b.state]
+        self.tuple_list = [[perm[pos] for pos in shape] for shape in shapes for perm in iso]
+        self.table = [t for t in range(len(shapes)) for _ in iso]
+        return
+    
+    def snapshot(self, stat, *agents):
+        """ take a checkpoint if the number of episodes reaches the interval, with the master seeds of the agents """
+        if self.ckpt is not None and self.ckpt.every:
+            self.ckpt.snapshot(self, stat, agents)
+        return
+    
+    def resume(self, stat, *agents):
+        """ continue from the last checkpoint, if the resume option is given """
+        if self.ckpt is not None and self.property("resume") is not None:
+            self.ckpt.restore(self, stat, agents)
+        return
+    
+    def quantize(self):
+        """
+        quantize the weight tables to int16 for evaluation only, e.g., "load=weights.bin alpha=0 quantize"
+        the features of a table are summed as integers and scaled once per table
+        """
+        if self.property("alpha") is None or float(self.property("alpha")) != 0:
+            raise ValueError('quantized weights are read-only, alpha=0 is required')
+        self.net = [quantweight(w) for w in self.net]
+        self.groups = [(w.value, w.scale, [i for i, t in enumerate(self.table) if t == k]) for k, w in enumerate(self.net)]
+        return
+    
+    def report(self):
+        """
+        show the memory usage of the weight tables
+        
+        the format would be
+            table 0       11390625 entries    6-tuple    touched 12.5%    resident 5.6 MiB
+        where touched is the fraction of the allocated pages for sparse tables, or of the nonzero weights otherwise
+        """
+        for t, w in enumerate(self.net):
+            print("\t" "table %-4d" "%12d entries" "%6d-tuple" "    touched %.1f%%" "    resident %.1f MiB" %
+                  (t, len(w), len(self.tuple_list[self.table.index(t)]), w.touched() * 100, w.resident() / 1048576))
+        print()
         return
     
     def __exit__(self, exc_type, exc_value, traceback):
+        if self.property("sparse") is not None:
+            self.report()
+        if self.ckpt is not None:
+            self.ckpt.close()
         save = self.property("save")
         if save is not None:
             self.save_weights(save)
@@ -115,6 +240,12 @@ class weight_agent(agent):
     
     
     def load_weights(self, path):
+        if weightfile.is_weightfile(path):
+            # memory-mapped, the tables are read-only (and shared between processes) if alpha=0
+            alpha = self.property("alpha")
+            self.net, tuple_list, table = weightfile.load(path, alpha is None or float(alpha) != 0)
+            self.set_tuples(tuple_list, table)
+            return
         input = open(path, 'rb')
         size = array('L')
         size.fromfile(input, 1)
@@ -122,12 +253,30 @@ class weight_agent(agent):
         for i in range(size):
             self.net += [weight()]
             self.net[-1].load(input)
+        # the legacy file has no tuple layout, so the tables are checked against the layout of the options
+        if len(self.net) != max(self.table) + 1 or any([len(self.net[t]) < 15 ** len(tup) for tup, t in zip(self.tuple_list, self.table)]):
+            raise ValueError(path + ': ' + str(len(self.net)) + ' tables do not match the tuple layout')
         return
     def save_weights(self, path):
-        output = open(path, 'wb')
-        array('L', [len(self.net)]).tofile(output)
+        weightfile.save(path, self.net, self.tuple_list, self.table)
+        return
+
+    def share(self):
+        """ move the weight tables into shared memory, return (name, size) of each table """
+        self.net = [w.dense() for w in self.net] # the shared tables are contiguous float32
+        return [(w.share(), len(w)) for w in self.net]
+    
+    def attach(self, tables):
+        """ use the weight tables shared by another process """
+        self.net = [weight() for _ in tables]
+        for w, (name, size) in zip(self.net, tables):
+            w.attach(name, size)
+        self.groups = None
+        return
+    
+    def detach(self, unlink = False):
         for w in self.net:
-            w.save(output)
+            w.detach(unlink)
         return
 
     def evaluate(self, state, op):
@@ -140,10 +289,39 @@ class weight_agent(agent):
         #print(feature)
         result = 0
         for i in range(len(feature)):
-            result += self.net[i][feature[i]]
+            result += self.net[self.table[i]][feature[i]]
         #print(r,result,r+result)
         return r+result
     
+    def features(self, state):
+        """ the n-tuple indices of a board, which can follow the board incrementally """
+        return feature(self.member, state.state)
+    
+    def afterstates(self, state, feat):
+        """
+        slide copies of the board in all four directions at once, where feat is the feature of the board
+        return a list of (reward, afterstate, feature of afterstate) indexed by opcode, where the entry is None if the action is illegal
+        """
+        tick = instrument.tick()
+        after = state.afterstates()
+        instrument.tock("slide", tick)
+        result = []
+        for entry in after:
+            if entry is not None:
+                b, r = entry
+                f = feat.copy()
+                f.update(b)
+                entry = r, b, f
+            result += [entry]
+        return result
+    
+    def value(self, feat):
+        """ the sum of weights indexed by the feature """
+        net, table, index = self.net, self.table, feat.index
+        if self.groups is not None:
+            return sum([scale * sum([value[index[i]] for i in group]) for value, scale, group in self.groups])
+        return sum([net[table[i]][index[i]] for i in range(len(index))])
+    
     def hash(self, state):
         feature = []
         for i in range(len(self.tuple_list)):
@@ -173,28 +351,41 @@ class rndenv(random_agent):
     """
     def __init__(self, options = ""):
         super().__init__("name=random role=environment " + options)
-        self.bag = [1,2,3]
+        self.bag = 0b111 # bit t-1 is set if tile t is in the bag
         return
     
     def take_action(self, state):
-        empty = [pos for pos, tile in enumerate(state.state) if not tile]
-        fil = [[12,13,14,15],[0,4,8,12],[0,1,2,3],[3,7,11,15]]
+        tick = instrument.tick()
+        empty = state.empty()
         if state.op is not None:
-            empty = list(filter(lambda x: x in fil[state.op], empty))
-        if empty:
-            pos = self.choice(empty)
-            if self.bag == []:
-                self.bag = [1,2,3]
-            tile = self.choice(self.bag)
-            self.bag.remove(tile)
+            cells = rndenv.cells[state.op][empty & rndenv.edges[state.op]]
+        else:
+            cells = [pos for pos in range(16) if empty >> pos & 1]
+        if cells:
+            pos = self.choice(cells)
+            if not self.bag:
+                self.bag = 0b111
+            tile = self.choice(rndenv.tiles[self.bag])
+            self.bag ^= 1 << (tile - 1)
+            instrument.tock("environment", tick)
             return action.place(pos, tile)
         else:
+            instrument.tock("environment", tick)
             return action()
-
-    def reset(self):
-        self.bag=[1,2,3]
-        return    
     
+    def reset(self):
+        self.bag = 0b111
+        return
+
+# the cells of the edge opposite to each sliding direction (up, right, down, left)
+rndenv.edges = [0xf000, 0x1111, 0x000f, 0x8888]
+# the empty cells (in ascending order) of each subset of an edge, indexed by direction and masked empty bitmask
+rndenv.cells = [{ sum([1 << pos for i, pos in enumerate(edge) if k >> i & 1]) : [pos for i, pos in enumerate(edge) if k >> i & 1] for k in range(16) }
+                for edge in [[12, 13, 14, 15], [0, 4, 8, 12], [0, 1, 2, 3], [3, 7, 11, 15]]]
+# the tiles (in ascending order) of each bag mask
+rndenv.tiles = [[t for t in (1, 2, 3) if bag >> (t - 1) & 1] for bag in range(8)]
+
+
 class player(random_agent):
     """
     dummy player
@@ -208,32 +399,196 @@ class player(random_agent):
             self.alpha = float(alpha)
         else:
             self.alpha = 0.0025
+        self.feature = None # the feature following the board
+        self.after = None # the feature of the last selected afterstate
+        self.evaluated = None # (packed board, legal afterstates) evaluated by learning, reused by the next move selection
+        # learn=episode defers the TD updates to a backward sweep at the end of each episode
+        self.trajectory = [] if self.property("learn") == "episode" else None
+        lamb = self.property("lambda")
+        self.lamb = float(lamb) if lamb is not None else 0
         return
     
-    def take_action(self, state, weight):
+    def track(self, state, weight):
+        """ let the tracked feature follow the board, rebuild it if the network changed """
+        if self.feature is None or self.feature.member is not weight.member:
+            self.feature = weight.features(state)
+        else:
+            self.feature.update(state)
+        return self.feature
+    
+    def evaluate(self, state, weight):
+        """ evaluate all legal afterstates, as a list of (op, value, feature of afterstate, reward) """
+        feat = self.track(state, weight)
+        legal = []
+        for op, after in enumerate(weight.afterstates(state, feat)):
+            if after is not None:
+                reward, b, f = after
+                legal += [(op, reward + weight.value(f), f, reward)]
+        return legal
+    
+    def take_action(self, state, weight, bag = None):
         #print(state)
-        legal = list(filter(lambda x:x[1] != None,[ (op, weight.evaluate(state, op)) for op in range(4) ]))       
+        tick = instrument.tick()
+        if self.evaluated is not None and self.evaluated[0] == bitboard.pack(state.state):
+            legal = self.evaluated[1]
+        else:
+            legal = self.evaluate(state, weight)
+        self.evaluated = None
+        instrument.tock("select", tick)
         if legal:
             argmax =  max(legal,key=itemgetter(1))
             op  = argmax[0]
             state.op = op
+            self.after = argmax[2]
+            if self.trajectory is not None and self.alpha != 0:
+                self.trajectory += [(argmax[2].index, argmax[1], argmax[3])] # afterstate, value, reward
             return action.slide(op)
         else:
             return action()
+    
+    def close_episode(self, flag = "", weight = None):
+        if self.trajectory:
+            tick = instrument.tick()
+            self.backward(weight)
+            instrument.tock("learning", tick)
+        self.trajectory = [] if self.trajectory is not None else None
+        self.evaluated = None
+        return
+    
+    def backward(self, weight):
+        """
+        backward TD(lambda) sweep over the recorded afterstates of the episode
+        the targets are built from the values stored at move selection, the terminal afterstate learns toward 0
+        """
+        rate, lamb = self.alpha, self.lamb
+        net, table = weight.net, weight.table
+        target = 0
+        for index, value, reward in reversed(self.trajectory):
+            V = sum([net[table[i]][index[i]] for i in range(len(index))])
+            error = rate * (target - V)
+            for i in range(len(index)):
+                net[table[i]][index[i]] += error
+            target = value + lamb * (target - (value - reward)) # r + (1 - lambda) V + lambda target
+        return
 
     def learning(self, cstate, state, weight):
-        if self.alpha == 0:
+        if self.alpha == 0 or self.trajectory is not None:
             return
+        tick = instrument.tick()
         rate = self.alpha
-        feature = weight.hash(cstate)     
-        legal = list(filter(lambda x:x[1] != None,[ (op, weight.evaluate(state, op)) for op in range(4) ])) 
+        # the afterstate feature is already computed when the action is selected
+        after = self.after if self.after is not None and self.after.tiles == cstate.state else weight.features(cstate)
+        self.feature = after.copy()
+        legal = self.evaluate(state, weight)
         if legal:
             argmax =  max(legal,key=itemgetter(1))
             td_target = argmax[1]
             #wrong formula
-            V = sum([weight.net[i][feature[i]] for i in range(len(feature))])
+            feature = after.index
+            V = weight.value(after)
             for i in range(len(feature)):
-                weight.net[i][feature[i]] += rate*(td_target - V)
+                weight.net[weight.table[i]][feature[i]] += rate*(td_target - V)
+            # the next move is selected on the same board, keep the afterstates with the values under the updated weights
+            self.evaluated = bitboard.pack(state.state), [(op, reward + weight.value(f), f, reward) for op, value, f, reward in legal]
+        instrument.tock("learning", tick)
+
+class search_player(player):
+    """
+    expectimax player
+    search the player moves and the rndenv chance nodes to a limited depth, and evaluate the leaves by the network
+    the chance node values are kept in a size-bounded LRU transposition table, which carries over between moves
+    
+    options: depth=N (plies, default 2), time=T (milliseconds per move, by iterative deepening), cache=N (entries)
+    """
+    def __init__(self, options = ""):
+        super().__init__("name=expectimax " + options)
+        depth, budget, cache = self.property("depth"), self.property("time"), self.property("cache")
+        self.depth = int(depth) if depth is not None else 2
+        self.budget = float(budget) if budget is not None else None
+        self.capacity = int(cache) if cache is not None else 1000000
+        self.cache = OrderedDict() # (afterstate, opcode, bag mask) --> (depth, value)
+        return
+    
+    def take_action(self, state, weight, bag = None):
+        tick = instrument.tick()
+        feat = self.track(state, weight)
+        start, self.deadline, best = time.perf_counter(), None, None
+        for depth in range(1, self.depth + 1):
+            try:
+                best = self.search(state, feat, bag, depth, weight)
+            except TimeoutError:
+                break # keep the result of the last completed depth
+            if self.budget is not None and self.deadline is None:
+                self.deadline = start + self.budget / 1000
+        instrument.tock("select", tick)
+        if best is not None:
+            op, value, f, reward = best
+            state.op = op
+            self.after = f
+            if self.trajectory is not None and self.alpha != 0:
+                self.trajectory += [(f.index, value, reward)] # afterstate, searched value, reward
+            return action.slide(op)
+        else:
+            return action()
+    
+    def learning(self, cstate, state, weight):
+        super().learning(cstate, state, weight)
+        if self.alpha != 0 and self.trajectory is None:
+            self.cache.clear() # the stored values are stale once the weights are updated
+        return
+    
+    def close_episode(self, flag = "", weight = None):
+        super().close_episode(flag, weight)
+        if self.alpha != 0 and self.trajectory is not None:
+            self.cache.clear() # the weights are updated by the backward sweep
+        return
+    
+    def search(self, state, feat, bag, depth, weight):
+        """ the best (op, value, feature of afterstate, reward) of a max node, or None if there is no legal move """
+        best = None
+        for op, after in enumerate(weight.afterstates(state, feat)):
+            if after is not None:
+                reward, b, f = after
+                value = reward + self.expect(b, f, op, bag, depth, weight)
+                if best is None or value > best[1]:
+                    best = op, value, f, reward
+        return best
+    
+    def expect(self, after, feat, op, bag, depth, weight):
+        """ the expected value of a chance node (an afterstate), where depth counts the remaining plies """
+        if depth <= 1:
+            return weight.value(feat)
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise TimeoutError()
+        bag = bag if bag else 0b111 # the bag is refilled before the next tile is drawn
+        key = bitboard.pack(after.state), op, bag
+        entry = self.cache.get(key)
+        if entry is not None and entry[0] >= depth:
+            self.cache.move_to_end(key)
+            return entry[1]
+        empty = rndenv.cells[op][after.empty() & rndenv.edges[op]]
+        tiles = rndenv.tiles[bag]
+        if empty:
+            value = 0
+            for pos in empty:
+                for tile in tiles:
+                    b = board(after)
+                    b.place(pos, tile)
+                    if b.is_terminal(): # the game is over, the value is 0
+                        continue
+                    f = feat.copy()
+                    f.place(pos, tile)
+                    best = self.search(b, f, bag ^ (1 << (tile - 1)), depth - 1, weight)
+                    value += best[1] if best is not None else 0
+            value /= len(empty) * len(tiles)
+        else:
+            best = self.search(after, feat, bag, depth - 1, weight)
+            value = best[1] if best is not None else 0
+        self.cache[key] = depth, value
+        if len(self.cache) > self.capacity:
+            self.cache.popitem(last = False)
+        return value
+    
 if __name__ == '__main__':
     print('2048 Demo: agent.py\n')
     pass
\ No newline at end of file
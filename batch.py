@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+"""
+Basic framework for developing 2048 programs in Python
+
+Author: Hung Guei (moporgic)
+        Computer Games and Intelligence (CGI) Lab, NCTU, Taiwan
+        http://www.aigames.nctu.edu.tw
+"""
+
+from board import board
+from action import action
+import numpy as np
+import time
+
+
+class batch:
+    """
+    vectorized environment that plays N games in lockstep
+    the boards are kept as an (N,16) uint8 array, the player moves greedily by the n-tuple network
+    and the environment places tiles as rndenv does (edge placement, bag of 1-2-3)
+    
+    note that the weights are read only, no learning happens in the batch
+    """
+    
+    def __init__(self, size, weight, seed = None, offset = 0):
+        """ the random stream is derived from the seed and the index offset, so the shards play different games """
+        self.size = size
+        self.rng = np.random.default_rng([seed, offset] if seed is not None else None)
+        if len(set([len(tup) for tup in weight.tuple_list])) != 1 or len(set([len(w) for w in weight.net])) != 1:
+            raise ValueError('the batch requires tuples of the same length')
+        self.net = np.stack([np.frombuffer(w.dense().value, dtype = np.float32) for w in weight.net])
+        self.tuples = np.array(weight.tuple_list)
+        self.table = np.array(weight.table)
+        self.radix = 15 ** np.arange(self.tuples.shape[1] - 1, -1, -1)
+        self.lines = np.array(board.lines)
+        self.row_result = np.array([row for row, reward, moved in board.row_table], dtype = np.uint8)
+        self.row_reward = np.array([reward for row, reward, moved in board.row_table], dtype = np.int32)
+        self.row_moved = np.array([moved for row, reward, moved in board.row_table], dtype = bool)
+        # the positions that the environment may place a tile after each opcode
+        self.edge = np.zeros((5, 16), dtype = bool)
+        for op, cells in enumerate([[12, 13, 14, 15], [0, 4, 8, 12], [0, 1, 2, 3], [3, 7, 11, 15]]):
+            self.edge[op, cells] = True
+        self.edge[4, :] = True # no previous slide
+        return
+    
+    def afterstates(self, boards):
+        """
+        slide every board in all four directions
+        return the afterstates (N,4,16), the rewards (N,4) and the legality (N,4)
+        """
+        keys = (boards[:, self.lines].astype(np.int32) << np.array([0, 4, 8, 12])).sum(-1) # (N,op,line)
+        after = np.empty((len(boards), 4, 16), dtype = np.uint8)
+        for op in range(4):
+            after[:, op][:, self.lines[op]] = self.row_result[keys[:, op]]
+        return after, self.row_reward[keys].sum(-1), self.row_moved[keys].any(-1)
+    
+    def evaluate(self, after):
+        """ evaluate the afterstates (...,16) by the n-tuple network with one gather """
+        index = (after[..., self.tuples].astype(np.int64) * self.radix).sum(-1) # (...,tuple)
+        return self.net[self.table, index].sum(-1)
+    
+    def take_action(self, boards):
+        """
+        select the greedy opcode of each board, or -1 if there is no legal move
+        return the opcodes (N,), the chosen afterstates (N,16) and their rewards (N,)
+        """
+        after, reward, legal = self.afterstates(boards)
+        value = np.full(legal.shape, -np.inf)
+        value[legal] = reward[legal] + self.evaluate(after[legal]) # the illegal afterstates are not evaluated
+        op = np.where(legal.any(1), value.argmax(1), -1)
+        index, chosen = np.arange(len(boards)), np.maximum(op, 0)
+        return op, after[index, chosen], reward[index, chosen]
+    
+    def place(self, boards, last, bag, mask):
+        """
+        place a random tile to each masked board, the position is limited by the last opcode
+        return the positions and the tiles, position is -1 if no tile is placed
+        """
+        empty = (boards == 0) & self.edge[last] & mask[:, None]
+        pos = np.where(empty.any(1), (self.rng.random(empty.shape) * empty).argmax(1), -1)
+        put = np.flatnonzero(pos >= 0)
+        refill = put[~bag[put].any(1)]
+        bag[refill] = True
+        tile = (self.rng.random((len(put), 3)) * bag[put]).argmax(1)
+        bag[put, tile] = False
+        boards[put, pos[put]] = tile + 1
+        return put, pos[put], tile + 1
+    
+    def run(self, stat, play, evil):
+        """ play until the statistic is finished, finished games are recycled into new ones """
+        flag = play.name() + ":" + evil.name()
+        n = min(self.size, stat.total - stat.count)
+        if n <= 0:
+            return
+        self.boards = np.zeros((n, 16), dtype = np.uint8)
+        self.last = np.full(n, 4)
+        self.bag = np.ones((n, 3), dtype = bool)
+        self.opened = [0] * n
+        self.codes = np.zeros((n, 1024), dtype = np.int32) # action codes of each game
+        self.rewards = np.zeros((n, 1024), dtype = np.int32)
+        self.length = np.zeros(n, dtype = np.int64)
+        active = np.ones(n, dtype = bool)
+        self.reset(active)
+        started = stat.count + n # the games recorded before, e.g., by --load or resume, are counted
+        
+        while active.any():
+            op, after, reward = self.take_action(self.boards)
+            over = np.flatnonzero(active & (op < 0))
+            for i in over:
+                self.finish(stat, play, evil, flag, i)
+                active[i] = started < stat.total
+                started += active[i]
+            if len(over):
+                self.reset(np.isin(np.arange(n), over) & active)
+            live = active & (op >= 0)
+            self.boards[live] = after[live]
+            self.last[live] = op[live]
+            self.record(np.flatnonzero(live), (action.slide.type | op[live]), reward[live])
+            put, pos, tile = self.place(self.boards, self.last, self.bag, live)
+            self.record(put, action.place.type | pos | (tile << 4), 0)
+        return
+    
+    def reset(self, mask):
+        """ start new games on the masked boards with the 9 initial tiles """
+        self.boards[mask] = 0
+        self.last[mask] = 4
+        self.bag[mask] = True
+        self.length[mask] = 0
+        for i in np.flatnonzero(mask):
+            self.opened[i] = millisec()
+        for _ in range(9):
+            put, pos, tile = self.place(self.boards, self.last, self.bag, mask)
+            self.record(put, action.place.type | pos | (tile << 4), 0)
+        return
+    
+    def record(self, index, code, reward):
+        """ append the action codes and rewards to the move records of the indexed games """
+        if len(index) and self.length[index].max() >= self.codes.shape[1]:
+            self.codes = np.concatenate([self.codes, np.zeros_like(self.codes)], 1)
+            self.rewards = np.concatenate([self.rewards, np.zeros_like(self.rewards)], 1)
+        self.codes[index, self.length[index]] = code
+        self.rewards[index, self.length[index]] = reward
+        self.length[index] += 1
+        return
+    
+    def finish(self, stat, play, evil, flag, i):
+        """ record a finished game into the statistic """
+        stat.open_episode(flag)
+        game = stat.back()
+        game.ep_open = flag, self.opened[i]
+        game.ep_state = board([int(t) for t in self.boards[i]])
+        size = self.length[i]
+        for code, reward in zip(self.codes[i, :size].tolist(), self.rewards[i, :size].tolist()):
+            game.ep_moves += [(decode(code), reward, 0)]
+            game.ep_score += reward
+        win = game.last_turns(play, evil)
+        stat.close_episode(win.name())
+        return
+
+
+def millisec():
+    return int(round(time.time() * 1000))
+
+def decode(code):
+    """ rebuild an action object from its code """
+    if code & 0xff000000 == action.slide.type:
+        return action.slide(code & 0x00ffffff)
+    return action.place(code & 0x0f, (code & 0x00ffffff) >> 4)
+
+
+if __name__ == '__main__':
+    print('2048 Demo: batch.py\n')
+    
+    from statistic import statistic
+    from agent import player, rndenv, weight_agent
+    stat = statistic(100, 50)
+    with player() as play, rndenv() as evil, weight_agent() as weight:
+        batch(32, weight, seed = 0).run(stat, play, evil)
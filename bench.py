@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the hot paths of the framework (fixed seeds)
+
+$ python3 -m bench --save=bench.json # save the results as the baseline
+$ python3 -m bench --baseline=bench.json --threshold=0.1 # exit 1 if any case is slower by more than 10%
+
+Author: Hung Guei (moporgic)
+        Computer Games and Intelligence (CGI) Lab, NCTU, Taiwan
+        http://www.aigames.nctu.edu.tw
+"""
+
+from board import board
+from statistic import statistic
+from agent import player
+from agent import rndenv
+from agent import weight_agent
+import contextlib
+import tracemalloc
+import random
+import json
+import time
+import io
+import sys
+
+
+def random_boards(count, seed = 0):
+    """ a fixed set of random boards """
+    rng = random.Random(seed)
+    return [board([rng.choice([0, 0, 0, 0, 1, 2, 3, 3, 4, 5, 6, 7]) for _ in range(16)]) for _ in range(count)]
+
+def random_network(seed = 0):
+    """ a network with fixed random weights, so the greedy player makes nontrivial moves """
+    weight = weight_agent()
+    rng = random.Random(seed)
+    for w in weight.net:
+        for i in range(0, len(w), 7):
+            w[i] = rng.uniform(-1, 1)
+    return weight
+
+def play_games(games, weight, seed = 0):
+    """ play a number of games with learning, return the statistic """
+    from threes import play_episode
+    stat = statistic(games)
+    play, evil = player("alpha=0.0025 seed=%d" % seed), rndenv("seed=%d" % seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        while not stat.is_finished():
+            stat.open_episode(play.name() + ":" + evil.name())
+            win = play_episode(stat.back(), play, evil, weight, stat.count)
+            stat.close_episode(win.name())
+    return stat
+
+def cases():
+    """ the benchmark cases, as (name, prepare) where prepare() returns (run, ops per run) """
+    def slide(op):
+        def prepare():
+            boards = random_boards(1000)
+            def run():
+                for b in boards:
+                    board(b).slide(op)
+            return run, len(boards)
+        return prepare
+    
+    def afterstates():
+        boards = random_boards(1000)
+        def run():
+            for b in boards:
+                b.afterstates()
+        return run, len(boards)
+    
+    def hash():
+        weight, boards = weight_agent(), random_boards(1000)
+        def run():
+            for b in boards:
+                weight.hash(b)
+        return run, len(boards)
+    
+    def evaluate():
+        weight, boards = random_network(), random_boards(250)
+        def run():
+            for b in boards:
+                for op in range(4):
+                    weight.evaluate(b, op)
+        return run, len(boards) * 4
+    
+    def learning():
+        weight, boards = random_network(), random_boards(250)
+        play = player("alpha=0.0025")
+        pairs = []
+        for b in boards:
+            cstate = board(b)
+            cstate.slide(3)
+            pairs += [(cstate, b)]
+        def run():
+            for cstate, state in pairs:
+                play.learning(cstate, state, weight)
+        return run, len(pairs)
+    
+    def environment():
+        evil, boards = rndenv("seed=0"), random_boards(1000)
+        for i, b in enumerate(boards):
+            b.op = i % 4
+        def run():
+            for b in boards:
+                evil.take_action(b)
+        return run, len(boards)
+    
+    def episode_io():
+        text = str(play_games(20, random_network()))
+        def run():
+            stat = statistic(0)
+            stat.load(io.StringIO(text))
+            stat.save(io.StringIO())
+        return run, 20
+    
+    def selfplay():
+        weight = random_network()
+        def run():
+            play_games(5, weight)
+        return run, 5
+    
+    return [("slide_up", slide(0)), ("slide_right", slide(1)), ("slide_down", slide(2)), ("slide_left", slide(3)),
+            ("afterstates", afterstates), ("hash", hash), ("evaluate", evaluate), ("learning", learning), ("environment", environment),
+            ("episode_io", episode_io), ("selfplay", selfplay)]
+
+def measure(prepare, repeat = 5):
+    """
+    return (ops per second, peak traced bytes of a run)
+    the speed is the best of several runs, the memory is the peak growth of traced memory during one run
+    note that the memory freed within the run is not counted, so it is not the allocation per op
+    """
+    run, ops = prepare()
+    run() # warm up
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        usage = time.perf_counter() - start
+        best = usage if best is None else min(best, usage)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return ops / best, peak - base
+
+def compare(results, baseline, threshold):
+    """ return the names of the cases slower than the baseline by more than the threshold """
+    slower = []
+    for name, result in results.items():
+        if name in baseline and result["ops"] < baseline[name]["ops"] * (1 - threshold):
+            slower += [name]
+    return slower
+
+
+if __name__ == '__main__':
+    print('threes Benchmark: ' + " ".join(sys.argv))
+    print()
+    
+    output, baseline, threshold, only = "", "", 0.1, []
+    for para in sys.argv[1:]:
+        if "--save=" in para:
+            output = para[(para.index("=") + 1):]
+        elif "--baseline=" in para:
+            baseline = para[(para.index("=") + 1):]
+        elif "--threshold=" in para:
+            threshold = float(para[(para.index("=") + 1):])
+        elif "--case=" in para:
+            only = para[(para.index("=") + 1):].split(",")
+    
+    results = {}
+    for name, prepare in cases():
+        if only and name not in only:
+            continue
+        ops, peak = measure(prepare)
+        results[name] = { "ops" : ops, "peak_bytes_per_run" : peak }
+        print("%-12s" "%14.1f ops/s" "%12d peak bytes/run" % (name, ops, peak))
+    print()
+    
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent = 1)
+    
+    if baseline:
+        with open(baseline, "r") as f:
+            slower = compare(results, json.load(f), threshold)
+        for name in slower:
+            print("regression: %s is slower than the baseline by more than %s%%" % (name, threshold * 100))
+        sys.exit(1 if slower else 0)
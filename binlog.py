@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+"""
+Basic framework for developing 2048 programs in Python
+
+Author: Hung Guei (moporgic)
+        Computer Games and Intelligence (CGI) Lab, NCTU, Taiwan
+        http://www.aigames.nctu.edu.tw
+"""
+
+from action import action
+from episode import episode
+import struct
+
+# compact binary episode log
+# each episode is a fixed header followed by its flags and moves
+# header: magic 'EP', open flag size, close flag size, number of moves, size of moves, open time, close time
+# moves: a presence bitmap (2 bits per move, nonzero reward | nonzero time), then for each move
+#        one action byte and the present values as zigzag varints (reward, time usage)
+# action byte: (position << 4) | tile for placing, (opcode << 4) for sliding (tile 0)
+header = struct.Struct('<2sBBIIqq')
+
+
+class writer:
+    """ streaming writer of the binary episode log """
+    
+    def __init__(self, output):
+        self.output = output
+        return
+    
+    def write(self, ep):
+        """ serialize an episode to the binary file object """
+        bitmap = bytearray((2 * len(ep.ep_moves) + 7) // 8)
+        moves = bytearray()
+        for k, (a, r, t) in enumerate(ep.ep_moves):
+            moves.append(encode(a))
+            if r:
+                bitmap[k >> 2] |= 1 << ((k & 3) << 1)
+                put_varint(moves, r)
+            if t:
+                bitmap[k >> 2] |= 2 << ((k & 3) << 1)
+                put_varint(moves, t)
+        moves = bitmap + moves
+        flags = str(ep.ep_open[0]).encode(), str(ep.ep_close[0]).encode()
+        self.output.write(header.pack(b'EP', len(flags[0]), len(flags[1]), len(ep.ep_moves), len(moves), ep.ep_open[1], ep.ep_close[1]))
+        self.output.write(flags[0] + flags[1])
+        self.output.write(moves)
+        return True
+
+
+class reader:
+    """ iterator of the episodes in a binary episode log """
+    
+    def __init__(self, input):
+        self.input = input
+        return
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        buf = self.input.read(header.size)
+        if len(buf) < header.size:
+            raise StopIteration
+        magic, nopen, nclose, count, size, topen, tclose = header.unpack(buf)
+        if magic != b'EP':
+            raise ValueError('bad episode header')
+        flags = self.input.read(nopen + nclose).decode()
+        moves = self.input.read(size)
+        ep = episode()
+        ep.ep_open = flags[:nopen], topen
+        ep.ep_close = flags[nopen:], tclose
+        i = (2 * count + 7) // 8
+        for k in range(count):
+            a, r, t = decode(moves[i]), 0, 0
+            i += 1
+            present = moves[k >> 2] >> ((k & 3) << 1)
+            if present & 1:
+                r, i = get_varint(moves, i)
+            if present & 2:
+                t, i = get_varint(moves, i)
+            ep.ep_moves += [(a, r, t)]
+        ep.ep_lazy = True # the state and score are replayed on demand
+        return ep
+
+
+def encode(a):
+    """ the action byte of an action """
+    if a.code & 0xff000000 == action.slide.type:
+        return a.event() << 4
+    if a.code & 0xff000000 == action.place.type and 0 < a.tile() < 16:
+        return (a.position() << 4) | a.tile()
+    raise ValueError('action ' + str(a) + ' cannot be encoded')
+
+def decode(byte):
+    """ the action of an action byte """
+    if byte & 0x0f:
+        return action.place(byte >> 4, byte & 0x0f)
+    return action.slide(byte >> 4)
+
+def put_varint(buf, value):
+    value = (value << 1) ^ (value >> 63) # zigzag
+    while value >= 0x80:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+    return
+
+def get_varint(buf, i):
+    """ return the value and the next position """
+    value, shift = 0, 0
+    while True:
+        byte = buf[i]
+        i += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return (value >> 1) ^ -(value & 1), i
+
+
+if __name__ == '__main__':
+    print('2048 Demo: binlog.py\n')
+    
+    import io
+    ep = episode()
+    ep.load(io.StringIO("open@100|01(1)11(1)#L[2](1)|close@200"))
+    output = io.BytesIO()
+    writer(output).write(ep)
+    print(len(output.getvalue()), 'bytes')
+    for ep in reader(io.BytesIO(output.getvalue())):
+        print(ep)
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+"""
+Basic framework for developing 2048 programs in Python
+
+Author: Hung Guei (moporgic)
+        Computer Games and Intelligence (CGI) Lab, NCTU, Taiwan
+        http://www.aigames.nctu.edu.tw
+"""
+
+from board import board
+
+
+class bitboard:
+    """
+    packed implementation of the puzzle, the whole grid is kept in one 64-bit integer
+    the tile at position i (1-d form index) is stored in bits [4i, 4i + 4)
+    
+    the interface is compatible with board, so it can be used by action, episode and statistic
+    """
+    __slots__ = ('raw', 'op')
+    score = board.score
+    
+    def __init__(self, state = None):
+        self.op = None
+        if state is None:
+            self.raw = 0
+        elif isinstance(state, int):
+            self.raw = state
+        elif isinstance(state, bitboard):
+            self.raw = state.raw
+        else:
+            self.raw = bitboard.pack(state[:])
+        return
+    
+    @staticmethod
+    def pack(tiles):
+        """ pack a list of 16 tiles into a 64-bit integer """
+        raw = 0
+        for pos, tile in enumerate(tiles):
+            raw |= tile << (pos << 2)
+        return raw
+    
+    @property
+    def state(self):
+        raw = self.raw
+        return [(raw >> s) & 0x0f for s in range(0, 64, 4)]
+    
+    @state.setter
+    def state(self, tiles):
+        self.raw = bitboard.pack(tiles)
+        return
+    
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return self.state[pos]
+        return (self.raw >> (pos << 2)) & 0x0f
+    
+    def __setitem__(self, pos, tile):
+        self.raw = (self.raw & ~(0x0f << (pos << 2))) | (tile << (pos << 2))
+        return
+    
+    def __eq__(self, other):
+        return isinstance(other, bitboard) and self.raw == other.raw
+    
+    def __hash__(self):
+        return hash(self.raw)
+    
+    def place(self, pos, tile):
+        """
+        place a tile (index value) to the specific position (1-d form index)
+        return 0 if the action is valid, or -1 if not
+        """
+        if pos >= 16 or pos < 0:
+            return -1
+        self[pos] = tile
+        return 0
+    
+    def empty(self):
+        """ the bitmask of the empty cells, bit i for position i """
+        x = self.raw | (self.raw >> 1)
+        x = ~(x | (x >> 2)) & 0x1111111111111111 # bit 4i is set if cell i is empty
+        x = (x | (x >> 3)) & 0x0303030303030303
+        x = (x | (x >> 6)) & 0x000f000f000f000f
+        x = (x | (x >> 12)) & 0x000000ff000000ff
+        return (x | (x >> 24)) & 0xffff
+    
+    def slide(self, opcode):
+        """
+        apply an action to the board
+        return the reward of the action, or -1 if the action is illegal
+        """
+        if opcode == 0:
+            return self.slide_up()
+        if opcode == 1:
+            return self.slide_right()
+        if opcode == 2:
+            return self.slide_down()
+        if opcode == 3:
+            return self.slide_left()
+        return -1
+    
+    def legal_moves(self):
+        """ the bitmask of the legal opcodes, bit op is set if the action is legal, no afterstate is built """
+        t = bitboard(self)
+        t.transpose()
+        move, rows, cols = board.can_move, self.raw, t.raw
+        return board.legal_table[(move[cols & 0xffff] | move[(cols >> 16) & 0xffff] | move[(cols >> 32) & 0xffff] | move[cols >> 48])
+                                 | ((move[rows & 0xffff] | move[(rows >> 16) & 0xffff] | move[(rows >> 32) & 0xffff] | move[rows >> 48]) << 2)]
+    
+    def is_terminal(self):
+        return not self.legal_moves()
+    
+    def afterstates(self):
+        """
+        slide copies of the board in all four directions
+        return a list of (afterstate, reward) indexed by opcode, where the entry is None if the action is illegal
+        the board is transposed once for both vertical directions
+        """
+        t = bitboard(self)
+        t.transpose()
+        after = []
+        for op, raw, table in ((0, t.raw, bitboard.left_table), (1, self.raw, bitboard.right_table),
+                               (2, t.raw, bitboard.right_table), (3, self.raw, bitboard.left_table)):
+            move, score = 0, 0
+            for s in (0, 16, 32, 48):
+                row, reward = table[(raw >> s) & 0xffff]
+                move |= row << s
+                score += reward
+            if move != raw:
+                b = bitboard(move)
+                if not op & 1:
+                    b.transpose()
+                after += [(b, score)]
+            else:
+                after += [None]
+        return after
+    
+    def slide_left(self):
+        return self.slide_rows(bitboard.left_table)
+    
+    def slide_right(self):
+        return self.slide_rows(bitboard.right_table)
+    
+    def slide_up(self):
+        self.transpose()
+        score = self.slide_left()
+        self.transpose()
+        return score
+    
+    def slide_down(self):
+        self.transpose()
+        score = self.slide_right()
+        self.transpose()
+        return score
+    
+    def slide_rows(self, table):
+        raw, move, score = self.raw, 0, 0
+        for s in (0, 16, 32, 48):
+            row, reward = table[(raw >> s) & 0xffff]
+            move |= row << s
+            score += reward
+        if move != raw:
+            self.raw = move
+            return score
+        return -1
+    
+    def reflect_horizontal(self):
+        x = self.raw
+        self.raw = (((x & 0x000f000f000f000f) << 12) | ((x & 0x00f000f000f000f0) << 4)
+                  | ((x & 0x0f000f000f000f00) >> 4) | ((x & 0xf000f000f000f000) >> 12))
+        return
+    
+    def reflect_vertical(self):
+        x = self.raw
+        self.raw = (((x & 0x000000000000ffff) << 48) | ((x & 0x00000000ffff0000) << 16)
+                  | ((x & 0x0000ffff00000000) >> 16) | ((x & 0xffff000000000000) >> 48))
+        return
+    
+    def transpose(self):
+        x = self.raw
+        x = (x & 0xf0f00f0ff0f00f0f) | ((x & 0x0000f0f00000f0f0) << 12) | ((x & 0x0f0f00000f0f0000) >> 12)
+        x = (x & 0xff00ff0000ff00ff) | ((x & 0x00ff00ff00000000) >> 24) | ((x & 0x00000000ff00ff00) << 24)
+        self.raw = x
+        return
+    
+    def rotate(self, rot = 1):
+        rot = ((rot % 4) + 4) % 4
+        if rot == 1:
+            self.rotate_right()
+            return
+        if rot == 2:
+            self.reverse()
+            return
+        if rot == 3:
+            self.rotate_left()
+            return
+        return
+    
+    def rotate_right(self):
+        """ clockwise rotate the board """
+        self.transpose()
+        self.reflect_horizontal()
+        return
+    
+    def rotate_left(self):
+        """ counterclockwise rotate the board """
+        self.transpose()
+        self.reflect_vertical()
+        return
+    
+    def reverse(self):
+        self.reflect_horizontal()
+        self.reflect_vertical()
+        return
+    
+    def __str__(self):
+        return board(self.state).__str__()
+
+
+def reverse_row(key):
+    return ((key & 0x000f) << 12) | ((key & 0x00f0) << 4) | ((key & 0x0f00) >> 4) | ((key & 0xf000) >> 12)
+
+def build_row_tables():
+    """
+    derive the packed row tables from board.row_table
+    each entry is (result row packed in nibbles, reward)
+    """
+    left, right = [], []
+    for key in range(65536):
+        row, reward, moved = board.row_table[key]
+        left += [(bitboard.pack(row), reward)]
+    for key in range(65536):
+        row, reward = left[reverse_row(key)]
+        right += [(reverse_row(row), reward)]
+    return left, right
+
+bitboard.left_table, bitboard.right_table = build_row_tables()
+
+
+if __name__ == '__main__':
+    print('2048 Demo: bitboard.py\n')
+    
+    state = bitboard()
+    state[10] = 10
+    state[3] = 3
+    print(state)
+    state.rotate_right()
+    print(state)
@@ -8,6 +8,9 @@ Author: Hung Guei (moporgic)
         http://www.aigames.nctu.edu.tw
 """
 
+from operator import itemgetter
+
+
 class board:
     """ simple implementation of 2048 puzzle """
     score = [0, 1, 2, 3, 6, 12, 24, 48, 96, 192, 384, 768, 1536, 3072, 6144]
@@ -33,6 +36,10 @@ class board:
         self.state[pos] = tile
         return 0
     
+    def empty(self):
+        """ the bitmask of the empty cells, bit i for position i """
+        return int(bytes(self.state).translate(board.zeros)[::-1], 2)
+    
     def slide(self, opcode):
         """
         apply an action to the board
@@ -48,48 +55,74 @@ class board:
             return self.slide_left()
         return -1
     
+    def keys(self):
+        """ the row table keys of the four rows and the four columns, each line is read from its first cell """
+        s = self.state
+        return (s[0] | (s[1] << 4) | (s[2] << 8) | (s[3] << 12),
+                s[4] | (s[5] << 4) | (s[6] << 8) | (s[7] << 12),
+                s[8] | (s[9] << 4) | (s[10] << 8) | (s[11] << 12),
+                s[12] | (s[13] << 4) | (s[14] << 8) | (s[15] << 12),
+                s[0] | (s[4] << 4) | (s[8] << 8) | (s[12] << 12),
+                s[1] | (s[5] << 4) | (s[9] << 8) | (s[13] << 12),
+                s[2] | (s[6] << 4) | (s[10] << 8) | (s[14] << 12),
+                s[3] | (s[7] << 4) | (s[11] << 8) | (s[15] << 12))
+    
+    def legal_moves(self):
+        """ the bitmask of the legal opcodes, bit op is set if the action is legal, no afterstate is built """
+        r0, r1, r2, r3, c0, c1, c2, c3 = self.keys()
+        move = board.can_move
+        return board.legal_table[(move[c0] | move[c1] | move[c2] | move[c3]) | ((move[r0] | move[r1] | move[r2] | move[r3]) << 2)]
+    
+    def is_terminal(self):
+        return not self.legal_moves()
+    
+    def afterstates(self):
+        """
+        slide copies of the board in all four directions
+        return a list of (afterstate, reward) indexed by opcode, where the entry is None if the action is illegal
+        the row and column keys are extracted once, and shared by the opposite directions
+        """
+        r0, r1, r2, r3, c0, c1, c2, c3 = self.keys()
+        forward, backward = board.row_table, board.reverse_table
+        after = []
+        for table, a, b, c, d, vertical in ((forward, c0, c1, c2, c3, True), (backward, r0, r1, r2, r3, False),
+                                            (backward, c0, c1, c2, c3, True), (forward, r0, r1, r2, r3, False)):
+            a, b, c, d = table[a], table[b], table[c], table[d]
+            if a[2] or b[2] or c[2] or d[2]:
+                tiles = a[0] + b[0] + c[0] + d[0] # the lines are concatenated, the columns need a transpose
+                result = board()
+                result.state = list(board.transposed(tiles) if vertical else tiles)
+                after += [(result, a[1] + b[1] + c[1] + d[1])]
+            else:
+                after += [None]
+        return after
+    
     def slide_left(self):
-        move, score = [], 0
-        for row in [self.state[r:r + 4] for r in range(0, 16, 4)]:
-            for i in range(len(row)-1):
-                if row[i] == 0 :
-                    if row[i+1] != 0:
-                        t = row[i+1]
-                        row[i+1] = row[i]
-                        row[i] = t
-                elif row[i] in [1,2]:
-                    if row[i+1] != row[i] and row[i+1] in [1,2]:
-                        row[i] = 3
-                        row[i+1] = 0
-                        score += self.score[row[i]]
-                elif row[i] == row[i+1]:
-                    row[i] += 1
-                    row[i+1] = 0
-                    score += self.score[row[i]]
-                move += [row[i]]
-            move += [row[-1]]
-        if move != self.state:
-            self.state = move
-            return score
-        return -1
+        return self.slide_lines(board.lines[3])
     
     def slide_right(self):
-        self.reflect_horizontal()
-        score = self.slide_left()
-        self.reflect_horizontal()
-        return score
+        return self.slide_lines(board.lines[1])
     
     def slide_up(self):
-        self.transpose()
-        score = self.slide_left()
-        self.transpose()
-        return score
+        return self.slide_lines(board.lines[0])
     
     def slide_down(self):
-        self.transpose()
-        score = self.slide_right()
-        self.transpose()
-        return score
+        return self.slide_lines(board.lines[2])
+    
+    def slide_lines(self, lines):
+        """
+        slide the four lines (each is listed in its sliding order) through the row table
+        return the reward of the action, or -1 if the action is illegal
+        """
+        state, table = self.state, board.row_table
+        move, score = False, 0
+        for a, b, c, d in lines:
+            row, reward, moved = table[state[a] | (state[b] << 4) | (state[c] << 8) | (state[d] << 12)]
+            if moved:
+                state[a], state[b], state[c], state[d] = row
+                score += reward
+                move = True
+        return score if move else -1
     
     def reflect_horizontal(self):
         self.state = [self.state[r + i] for r in range(0, 16, 4) for i in reversed(range(4))]
@@ -141,6 +174,59 @@ class board:
         return state
     
     
+def slide_row(row):
+    """
+    slide a single row (list of 4 tiles) to the left in place
+    return the reward of the sliding
+    """
+    score = 0
+    for i in range(len(row)-1):
+        if row[i] == 0 :
+            if row[i+1] != 0:
+                t = row[i+1]
+                row[i+1] = row[i]
+                row[i] = t
+        elif row[i] in [1,2]:
+            if row[i+1] != row[i] and row[i+1] in [1,2]:
+                row[i] = 3
+                row[i+1] = 0
+                score += board.score[row[i]]
+        elif row[i] == row[i+1] and row[i] < 14: # 6144 is the largest tile, as the indices of the n-tuples are base 15
+            row[i] += 1
+            row[i+1] = 0
+            score += board.score[row[i]]
+    return score
+
+def build_row_table():
+    """
+    precompute the left sliding of every 4-tile row, indexed by the row packed in nibbles
+    each entry is (result row, reward, moved)
+    """
+    table = []
+    for key in range(65536):
+        row = [(key >> s) & 0x0f for s in (0, 4, 8, 12)]
+        before = row[:]
+        reward = slide_row(row)
+        table += [(tuple(row), reward, row != before)]
+    return table
+
+board.row_table = build_row_table()
+board.reverse_key = [((k & 0x000f) << 12) | ((k & 0x00f0) << 4) | ((k & 0x0f00) >> 4) | ((k & 0xf000) >> 12) for k in range(65536)] # the key of the reversed row
+# the row table of sliding toward the last cell, i.e., (result tuple, reward, moved) of the reversed row, with the result reversed back
+board.reverse_table = [(row[::-1], reward, moved) for row, reward, moved in [board.row_table[board.reverse_key[k]] for k in range(65536)]]
+# whether a line can slide toward its first cell (bit 0) or its last cell (bit 1)
+board.can_move = [board.row_table[k][2] | (board.reverse_table[k][2] << 1) for k in range(65536)]
+# the legal opcodes (up, right, down, left) of the columns' moves (bit 0-1) and the rows' moves (bit 2-3)
+board.legal_table = [(m & 1) | ((m >> 3 & 1) << 1) | ((m >> 1 & 1) << 2) | ((m >> 2 & 1) << 3) for m in range(16)]
+board.transposed = itemgetter(0, 4, 8, 12, 1, 5, 9, 13, 2, 6, 10, 14, 3, 7, 11, 15)
+board.zeros = bytes([ord('1')] + [ord('0')] * 255) # the binary digit of each tile for board.empty
+# the lines of each opcode (up, right, down, left), listed from the sliding edge
+board.lines = [[(c, c + 4, c + 8, c + 12) for c in range(4)],
+               [(r + 3, r + 2, r + 1, r) for r in range(0, 16, 4)],
+               [(c + 12, c + 8, c + 4, c) for c in range(4)],
+               [(r, r + 1, r + 2, r + 3) for r in range(0, 16, 4)]]
+    
+    
 if __name__ == '__main__':
     print('2048 Demo: board.py\n')
     
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+"""
+Basic framework for developing 2048 programs in Python
+
+Author: Hung Guei (moporgic)
+        Computer Games and Intelligence (CGI) Lab, NCTU, Taiwan
+        http://www.aigames.nctu.edu.tw
+"""
+
+from weight import weight
+from collections import deque
+from array import array
+import weightfile
+import threading
+import pickle
+import struct
+import zlib
+import sys
+import os
+
+# checkpoint files of a training run, all named by a common prefix
+# <prefix>.<seq>.bin: a full snapshot of the weights, see weightfile
+# <prefix>.<seq>.delta: the table pages changed since the previous checkpoint
+#     header: magic 'NTWD', number of pages
+#     pages: table, byte offset, byte size, crc32 of the page, then the page (little-endian float32)
+# <prefix>.state: the chain of snapshot files to replay, the master seeds of the agents, and the statistic counters
+#     it is replaced atomically after the files of the chain are written, so a crash leaves the previous checkpoint intact
+delta_header = struct.Struct('<4sI')
+delta_page = struct.Struct('<IQII')
+
+
+class checkpoint:
+    """ periodic snapshots of the weight tables, written by a background thread """
+    
+    def __init__(self, prefix, every, full = 1):
+        """
+        snapshot every 'every' episodes
+        every 'full'-th snapshot is a full one, the others are deltas of the previous snapshot
+        """
+        self.prefix = prefix
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok = True)
+        self.every = every
+        self.full = max(full, 1)
+        self.seq = 0
+        self.chain = [] # the files to replay, a full snapshot followed by deltas
+        self.last = None # the table bytes of the previous snapshot
+        self.thread = None
+        self.error = None # the exception raised by the background writer
+        return
+    
+    def snapshot(self, weight, stat, agents = ()):
+        """
+        take a snapshot if the number of episodes reaches the interval
+        the master seeds of the agents are kept, so the resumed episodes draw the same random streams
+        only the copies are made here, the diffing and writing are done in the background
+        """
+        if stat.count == 0 or stat.count % self.every:
+            return False
+        tables = [bytes(weightfile.little_endian(w.value)) for w in weight.net]
+        state = { "seeds" : [agent.seed for agent in agents],
+                  "count" : stat.count, "data" : list(stat.data), "accu" : [v[:] if type(v) is list else v for v in stat.accu] }
+        layout = (weight.tuple_list, weight.table)
+        self.wait() # at most one snapshot is being written
+        self.thread = threading.Thread(target = self.background, args = (tables, layout, state))
+        self.thread.start()
+        return True
+    
+    def wait(self):
+        """ wait for the snapshot being written, and raise the error of the writer if any """
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        return
+    
+    def background(self, tables, layout, state):
+        try:
+            self.write(tables, layout, state)
+        except Exception as e:
+            self.error = e
+        return
+    
+    def write(self, tables, layout, state):
+        self.seq += 1
+        if self.last is None or len(self.last) != len(tables) or self.seq % self.full == 1 % self.full:
+            path = self.prefix + "." + str(self.seq) + ".bin"
+            net = []
+            for data in tables:
+                w = weight()
+                w.value = array('f')
+                w.value.frombytes(data)
+                if sys.byteorder != 'little':
+                    w.value.byteswap()
+                net += [w]
+            weightfile.save(path, net, *layout)
+            chain = [path]
+        else:
+            path = self.prefix + "." + str(self.seq) + ".delta"
+            with open(path, 'wb') as output:
+                pages = list(changed(self.last, tables))
+                output.write(delta_header.pack(b'NTWD', len(pages)))
+                for t, offset, page in pages:
+                    output.write(delta_page.pack(t, offset, len(page), zlib.crc32(page)))
+                    output.write(page)
+            chain = self.chain + [path]
+        state["chain"] = [os.path.basename(file) for file in chain]
+        with open(self.prefix + ".state.tmp", 'wb') as output:
+            pickle.dump(state, output)
+        os.replace(self.prefix + ".state.tmp", self.prefix + ".state")
+        for file in self.chain:
+            if file not in chain:
+                os.remove(file)
+        self.chain, self.last = chain, tables
+        return
+    
+    def restore(self, weight, stat, agents = ()):
+        """ restore the weights, the master seeds of the agents, and the statistic counters of the last checkpoint """
+        with open(self.prefix + ".state", 'rb') as input:
+            state = pickle.load(input)
+        folder = os.path.dirname(self.prefix)
+        chain = [os.path.join(folder, file) for file in state["chain"]]
+        weight.net, tuple_list, table = weightfile.load(chain[0])
+        weight.set_tuples(tuple_list, table)
+        for path in chain[1:]:
+            with open(path, 'rb') as input:
+                magic, count = delta_header.unpack(input.read(delta_header.size))
+                if magic != b'NTWD':
+                    raise ValueError(path + ': not a delta checkpoint')
+                for _ in range(count):
+                    t, offset, size, crc = delta_page.unpack(input.read(delta_page.size))
+                    page = input.read(size)
+                    if zlib.crc32(page) != crc:
+                        raise ValueError(path + ': corrupted page at ' + str(offset))
+                    if sys.byteorder != 'little':
+                        page = array('f', page)
+                        page.byteswap()
+                        page = page.tobytes()
+                    memoryview(weight.net[t].value).cast('B')[offset:offset + size] = page
+        for agent, seed in zip(agents, state["seeds"]):
+            agent.seed = seed
+        stat.count, stat.data, stat.accu = state["count"], deque(state["data"]), state["accu"]
+        self.seq, self.chain = int(chain[-1].split(".")[-2]), chain
+        self.last = [bytes(weightfile.little_endian(w.value)) for w in weight.net]
+        return
+    
+    def close(self):
+        self.wait()
+        return
+
+
+def changed(last, tables):
+    """ the (table, byte offset, page) of the pages that differ """
+    page = weightfile.page
+    for t, (old, new) in enumerate(zip(last, tables)):
+        for offset in range(0, len(new), page):
+            if old[offset:offset + page] != new[offset:offset + page]:
+                yield t, offset, new[offset:offset + page]
+    return
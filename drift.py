@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+"""
+Drift of the quantized network against the float32 network over a fixed set of seeded games
+
+$ python3 -m drift --play="load=weights.bin" --evil="seed=1" --total=1000
+
+Author: Hung Guei (moporgic)
+        Computer Games and Intelligence (CGI) Lab, NCTU, Taiwan
+        http://www.aigames.nctu.edu.tw
+"""
+
+from statistic import statistic
+from agent import player
+from agent import rndenv
+from agent import weight_agent
+import contextlib
+import io
+import sys
+
+
+def play_games(total, play_args, evil_args):
+    """ play the seeded games by the network of the options, return the statistic and the memory of the tables """
+    from threes import play_episode
+    stat = statistic(total)
+    with contextlib.redirect_stdout(io.StringIO()):
+        play, evil, weight = player(play_args), rndenv(evil_args), weight_agent(play_args)
+        while not stat.is_finished():
+            stat.open_episode(play.name() + ":" + evil.name())
+            win = play_episode(stat.back(), play, evil, weight, stat.count)
+            stat.close_episode(win.name())
+    return stat, sum([w.resident() for w in weight.net])
+
+def reach(stat):
+    """ the fraction of the games reaching each tile """
+    count = [0] * 16
+    for ep in stat.data:
+        count[max(ep.state().state)] += 1
+    return [sum(count[t:]) / len(stat.data) for t in range(16)]
+
+def same(a, b):
+    """ the fraction of the games with exactly the same moves """
+    return sum([[m[0].code for m in x.ep_moves] == [m[0].code for m in y.ep_moves] for x, y in zip(a.data, b.data)]) / len(a.data)
+
+
+if __name__ == '__main__':
+    print('threes Drift: ' + " ".join(sys.argv))
+    print()
+    
+    total, play_args, evil_args = 1000, "", "seed=0"
+    for para in sys.argv[1:]:
+        if "--total=" in para:
+            total = int(para[(para.index("=") + 1):])
+        elif "--play=" in para:
+            play_args = para[(para.index("=") + 1):]
+        elif "--evil=" in para:
+            evil_args = para[(para.index("=") + 1):]
+    if "seed=" not in evil_args:
+        evil_args += " seed=0" # the same games for both networks
+    
+    play_args += " alpha=0"
+    base, base_bytes = play_games(total, play_args, evil_args)
+    quant, quant_bytes = play_games(total, play_args + " quantize", evil_args)
+    
+    avg = lambda stat: sum([ep.score() for ep in stat.data]) / len(stat.data)
+    print("%-10s" "%14s" "%14s" "%14s" % ("", "float32", "int16", "drift"))
+    print("%-10s" "%14.1f" "%14.1f" "%+13.2f%%" % ("avg", avg(base), avg(quant), (avg(quant) - avg(base)) * 100 / avg(base) if avg(base) else 0))
+    least = min([max(ep.state().state) for stat in (base, quant) for ep in stat.data]) # the tiles reached by all games are skipped, as show() does
+    for t, (x, y) in enumerate(zip(reach(base), reach(quant))):
+        if t >= least and (x or y):
+            print("%-10d" "%13.1f%%" "%13.1f%%" "%+13.2f%%" % (statistic.score[t] if t < len(statistic.score) else 0, x * 100, y * 100, (y - x) * 100))
+    print("%-10s" "%13.1f%%" % ("same", same(base, quant) * 100))
+    print("%-10s" "%12.1fMiB" "%12.1fMiB" % ("tables", base_bytes / 1048576, quant_bytes / 1048576))
+    print()
@@ -12,6 +12,7 @@ from board import board
 from action import action
 import time
 import io
+import re
 
 
 class episode:
@@ -22,11 +23,33 @@ class episode:
         return
     
     def state(self):
+        if self.ep_lazy:
+            self.replay()
         return self.ep_state
     
     def score(self):
+        if self.ep_lazy:
+            self.replay()
         return self.ep_score
     
+    def replay(self):
+        """
+        rebuild the final state and score of a loaded episode from its moves
+        the action codes are applied to the board directly, without dispatching through the action objects
+        """
+        state, score = self.initial_state(), 0
+        for move in self.ep_moves:
+            code = move[0].code
+            kind, event = code & 0xff000000, code & 0x00ffffff
+            if kind == action.slide.type:
+                score += state.slide(event)
+            elif kind == action.place.type:
+                score += state.place(event & 0x0f, event >> 4)
+            else:
+                score -= 1 # unknown action
+        self.ep_state, self.ep_score, self.ep_lazy = state, score, False
+        return
+    
     def open_episode(self, tag = ""):
         self.ep_open = tag, self.millisec()  # flag, time usage
         return
@@ -39,14 +62,19 @@ class episode:
         reward = move.apply(self.state())
         if reward == -1:
             return False
-        usage = self.millisec() - self.ep_time
-        record = move, reward, usage # action, reward, time usage
+        usage = self.nanosec() - self.ep_time
+        who = move.code & 0xff000000
+        total = self.ep_usage.get(who, 0)
+        self.ep_usage[who] = total + usage
+        # the milliseconds recorded are the differences of the rounded total usages, so a reloaded episode keeps the totals of the roles
+        usage = int(round(self.ep_usage[who] / 1000000)) - int(round(total / 1000000))
+        record = move, reward, usage # action, reward, time usage (milliseconds)
         self.ep_moves += [record]
         self.ep_score += reward
         return True
     
     def take_turns(self, play, evil):
-        self.ep_time = self.millisec()
+        self.ep_time = self.nanosec()
         s = self.step()
         if s > 8 and s%2 != 0:
             return play
@@ -65,11 +93,10 @@ class episode:
         return size
     
     def time(self, who = -1):
-        if self.ep_moves:
-            if who == action.slide.type:
-                return sum([mv[2] for mv in self.ep_moves[slice(2, self.step(), 2)]]) # action, reward, time usage
-            if who == action.place.type:
-                return self.ep_moves[0][2] + sum([mv[2] for mv in self.ep_moves[slice(1, self.step(), 2)]]) # action, reward, time usage
+        if self.ep_usage and who in [action.slide.type, action.place.type]:
+            return self.ep_usage.get(who, 0) / 1000000 # the high-resolution usages of a played episode
+        if self.ep_moves and who in [action.slide.type, action.place.type]:
+            return sum([mv[2] for mv in self.ep_moves if mv[0].code & 0xff000000 == who]) # action, reward, time usage
         return self.ep_close[1] - self.ep_open[1] # flag, time usage
     
     def actions(self, who = -1):
@@ -101,41 +128,30 @@ class episode:
             # close --> flag@time
             delim = close.index("@")
             self.ep_close = close[0:delim], int(close[(delim + 1):])
-            # moves --> action[reward](time)...
-            minput = io.StringIO(moves)
-            while True:
-                # check if EOF
-                ipt = minput.tell()
-                if minput.read(1) == "":
-                    break
-                minput.seek(ipt)
+            # moves --> action[reward](time)..., tokenized in one pass
+            pos, tokens = 0, episode.tokens
+            while pos < len(moves):
+                m = episode.move_pattern.match(moves, pos)
+                if m is None:
+                    raise ValueError(moves[pos:])
+                pos = m.end()
+                # a bracket that is never closed, e.g., "01[7" or "01(5", is malformed rather than another action
+                if m.group(3) is None and (moves.startswith("(", pos) or (m.group(2) is None and moves.startswith("[", pos))):
+                    raise ValueError(moves[pos:])
                 # ?? --> action
-                a = action.parse(minput)
-                self.ep_score += a.apply(self.ep_state)
-                # [?] --> reward
-                r = self.load_optional_value(minput, "[]")
-                # (?) --> time
-                t = self.load_optional_value(minput, "()")
+                proto = tokens.get(m.group(1))
+                a = proto[0](*proto[1:]) if proto is not None else action()
+                # [?] --> reward, (?) --> time
+                r = int(m.group(2)) if m.group(2) is not None else 0
+                t = int(m.group(3)) if m.group(3) is not None else 0
                 # (action, reward, time)
                 self.ep_moves += [(a, r, t)]
+            self.ep_lazy = True # the state and score are replayed on demand
             return True
         except (RuntimeError, ValueError, IndexError):
             pass
         return False
     
-    def load_optional_value(self, minput, flag):
-        t = 0
-        ipt = minput.tell()
-        if minput.read(1) == flag[0]:
-            buf = minput.read()
-            t = buf[0:buf.index(flag[-1])]
-            minput.seek(ipt + len(t) + 2)
-            t = int(t)
-        else:
-            minput.seek(ipt)
-            t = 0
-        return t
-    
     def __str__(self):
         open = str(self.ep_open[0]) + "@" + str(self.ep_open[1])
         moves = "".join([str(m[0]) + ("[" + str(m[1]) + "]" if m[1] else "") + ("(" + str(m[2]) + ")" if m[2] else "") for m in self.ep_moves])
@@ -145,18 +161,29 @@ class episode:
     def clear(self):
         self.ep_state = self.initial_state()
         self.ep_score = 0
-        self.ep_time = 0
+        self.ep_lazy = False
+        self.ep_time = 0 # the start of the current move, in nanoseconds
+        self.ep_usage = {} # action type --> total time usage in nanoseconds, only for played episodes
         self.ep_moves = []
         self.ep_open = "N/A", 0 # flag, time usage
         self.ep_close = "N/A", 0 # flag, time usage
         return
     
     def initial_state(self):
-        return board()
+        return episode.board()
     
     def millisec(self):
         return int(round(time.time() * 1000))
+    
+    def nanosec(self):
+        return time.perf_counter_ns()
         
+episode.board = board # the board type of new episodes, e.g., bitboard
+episode.move_pattern = re.compile(r"(..)(?:\[([^\]]*)\])?(?:\(([^)]*)\))?")
+episode.tokens = {} # action string --> (action type, arguments...)
+episode.tokens.update({ action.slide.res[op] : (action.slide, op) for op in range(4) })
+episode.tokens.update({ action.place.res[pos] + action.place.res[tile] : (action.place, pos, tile) for pos in range(16) for tile in range(1, 36) })
+    
     
 if __name__ == '__main__':
     print('2048 Demo: episode.py\n')
@@ -220,4 +247,7 @@ if __name__ == '__main__':
     print(eptest)
     print(ep)
     
+    for eptest in ["open@0|01(5|close@0", "open@0|01[7|close@0", "open@0|01[7](5|close@0"]:
+        print(eptest, episode().load(io.StringIO(eptest))) # unclosed brackets are malformed
+    
     
\ No newline at end of file
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+"""
+Basic framework for developing 2048 programs in Python
+
+Author: Hung Guei (moporgic)
+        Computer Games and Intelligence (CGI) Lab, NCTU, Taiwan
+        http://www.aigames.nctu.edu.tw
+"""
+
+
+class feature:
+    """
+    n-tuple indices of a board, which follow the board incrementally
+    only the tuples covering a changed cell are updated, by the per-cell index strides
+    """
+    
+    def __init__(self, member, tiles = None, index = None):
+        """
+        member[pos] lists the (tuple, stride) pairs that cover the position
+        the indices are computed from scratch if they are not given
+        """
+        self.member = member
+        self.tiles = tiles[:] if tiles is not None else [0] * 16
+        if index is not None:
+            self.index = index[:]
+        else:
+            self.index = [0] * (max([i for m in member for i, s in m]) + 1)
+            for pos, tile in enumerate(self.tiles):
+                for i, stride in member[pos]:
+                    self.index[i] += tile * stride
+        return
+    
+    def copy(self):
+        return feature(self.member, self.tiles, self.index)
+    
+    def place(self, pos, tile):
+        """ change the tile at the specific position, and the indices of its tuples """
+        delta = tile - self.tiles[pos]
+        if delta:
+            self.tiles[pos] = tile
+            index = self.index
+            for i, stride in self.member[pos]:
+                index[i] += delta * stride
+        return
+    
+    def update(self, state):
+        """ follow a board (e.g., after sliding or placing), only the changed cells are touched """
+        tiles = state.state
+        for pos in range(16):
+            if tiles[pos] != self.tiles[pos]:
+                self.place(pos, tiles[pos])
+        return
+
+
+if __name__ == '__main__':
+    print('2048 Demo: feature.py\n')
+    
+    member = [[(pos // 4, 15 ** (3 - pos % 4))] for pos in range(16)] # 4 rows
+    f = feature(member)
+    f.place(5, 3)
+    print(f.index)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""
+Basic framework for developing 2048 programs in Python
+
+Author: Hung Guei (moporgic)
+        Computer Games and Intelligence (CGI) Lab, NCTU, Taiwan
+        http://www.aigames.nctu.edu.tw
+"""
+
+import time
+
+# high-resolution timers of the hot paths, accumulated by name
+#
+# usage:
+#     tick = instrument.tick()
+#     ... # the measured phase
+#     instrument.tock("select", tick)
+#
+# the timers cost only a flag test unless instrument.enable() is called
+# the phases used by the framework are
+#     select: move selection of the player (player.take_action)
+#     slide: board sliding of the afterstates (weight_agent.afterstates)
+#     environment: tile placement of the environment (rndenv.take_action)
+#     learning: TD updates of the player (player.learning and the episode-end sweep)
+# note that the phases may be nested, e.g., slide is a part of select and learning
+enabled = False
+counters = {} # name --> [calls, nanoseconds]
+
+
+def enable(flag = True):
+    global enabled
+    enabled = flag
+    return
+
+def tick():
+    """ the start time of a phase, in nanoseconds """
+    return time.perf_counter_ns() if enabled else 0
+
+def tock(name, start):
+    """ accumulate the time since start to the named phase """
+    if enabled:
+        usage = time.perf_counter_ns() - start
+        counter = counters.get(name)
+        if counter is None:
+            counter = counters[name] = [0, 0]
+        counter[0] += 1
+        counter[1] += usage
+    return
+
+def reset():
+    counters.clear()
+    return
+
+def report():
+    """
+    show the accumulated timers
+    
+    the format would be
+        select         41093 calls    1052.412 ms    25609 ns/call
+    """
+    for name, (calls, usage) in counters.items():
+        print("\t" "%-12s" "%10d calls" "%12.3f ms" "%10d ns/call" % (name, calls, usage / 1e6, usage / calls if calls else 0))
+    print()
+    return
+
+
+if __name__ == '__main__':
+    print('2048 Demo: instrument.py\n')
+    
+    enable()
+    start = tick()
+    sum(range(100000))
+    tock("sum", start)
+    report()
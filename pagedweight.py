@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+"""
+Basic framework for developing 2048 programs in Python
+
+Author: Hung Guei (moporgic)
+        Computer Games and Intelligence (CGI) Lab, NCTU, Taiwan
+        http://www.aigames.nctu.edu.tw
+"""
+
+from weight import weight
+from array import array
+
+
+class pagedweight(weight):
+    """
+    weight table allocated in pages on the first write, the untouched pages read as zeros
+    large tables (e.g., 15^6 entries of 6-tuples) only take the memory of the visited regions
+    """
+    
+    shift = 12 # 4096 entries (16 KiB) per page
+    
+    def __init__(self, len = 0):
+        self.size = len
+        self.pages = [None] * ((len + (1 << pagedweight.shift) - 1) >> pagedweight.shift)
+        return
+    
+    def __getitem__(self, index):
+        page = self.pages[index >> pagedweight.shift]
+        return page[index & ((1 << pagedweight.shift) - 1)] if page is not None else 0.0
+    
+    def __setitem__(self, index, value):
+        page = self.pages[index >> pagedweight.shift]
+        if page is None:
+            page = self.pages[index >> pagedweight.shift] = array('f', bytes(4 << pagedweight.shift))
+        page[index & ((1 << pagedweight.shift) - 1)] = value
+        return
+    
+    def __len__(self):
+        return self.size
+    
+    @property
+    def value(self):
+        """ a contiguous copy of the table, e.g., for saving """
+        value = array('f')
+        zeros = bytes(4 << pagedweight.shift)
+        for page in self.pages:
+            value.frombytes(page.tobytes() if page is not None else zeros)
+        del value[self.size:]
+        return value
+    
+    @value.setter
+    def value(self, value):
+        """ fill the table from a contiguous buffer, only the pages with nonzero weights are kept """
+        value = array('f', bytes(value))
+        self.size = len(value)
+        step = 1 << pagedweight.shift
+        self.pages = []
+        for i in range(0, self.size, step):
+            page = value[i:i + step]
+            page.extend([0.0] * (step - len(page)))
+            self.pages += [page if any(page) else None]
+        return
+    
+    def touched(self):
+        """ the fraction of the allocated pages """
+        return sum([page is not None for page in self.pages]) / len(self.pages) if self.pages else 0
+    
+    def resident(self):
+        """ the bytes of the allocated pages """
+        return sum([page is not None for page in self.pages]) * (4 << pagedweight.shift)
+    
+    def dense(self):
+        """ a contiguous weight table with the same values """
+        w = weight()
+        w.value = self.value
+        return w
+
+
+if __name__ == '__main__':
+    print('2048 Demo: pagedweight.py\n')
+    
+    w = pagedweight(15 ** 6)
+    w[123456] += 0.5
+    print(len(w), w[123456], w[0], w.touched(), w.resident())
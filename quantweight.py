@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+"""
+Basic framework for developing 2048 programs in Python
+
+Author: Hung Guei (moporgic)
+        Computer Games and Intelligence (CGI) Lab, NCTU, Taiwan
+        http://www.aigames.nctu.edu.tw
+"""
+
+from weight import weight
+from array import array
+
+
+class quantweight(weight):
+    """
+    read-only weight table quantized to int16, where the weight is value * scale
+    the scale maps the largest magnitude of the table to 32767, so the rounding error is at most scale / 2
+    """
+    
+    def __init__(self, source = None):
+        values = source.value if source is not None else array('f')
+        peak = max(max(values, default = 0), -min(values, default = 0))
+        self.scale = peak / 32767 if peak else 1.0
+        inverse = 1 / self.scale
+        self.value = array('h', [round(v * inverse) for v in values])
+        return
+    
+    def __getitem__(self, index):
+        return self.value[index] * self.scale
+    
+    def __setitem__(self, index, value):
+        raise TypeError('quantized weights are read-only')
+    
+    def touched(self):
+        """ the fraction of the nonzero weights """
+        return 1 - self.value.count(0) / len(self.value) if len(self.value) else 0
+    
+    def resident(self):
+        """ the bytes of the table """
+        return 2 * len(self.value)
+    
+    def dense(self):
+        """ a contiguous float32 weight table of the dequantized values """
+        w = weight()
+        w.value = array('f', [v * self.scale for v in self.value])
+        return w
+
+
+if __name__ == '__main__':
+    print('2048 Demo: quantweight.py\n')
+    
+    w = weight(4)
+    w[1], w[2] = 0.5, -123.25
+    q = quantweight(w)
+    print([q[i] for i in range(4)], q.scale)
@@ -11,6 +11,9 @@ Author: Hung Guei (moporgic)
 from board import board
 from action import action
 from episode import episode
+from collections import deque
+import binlog
+import instrument
 
 
 class statistic:
@@ -27,8 +30,9 @@ class statistic:
         self.total = total
         self.block = block if block else total
         self.limit = limit if limit else total
-        self.data = []
+        self.data = deque()
         self.count = 0
+        self.accu = self.accumulator() # running aggregates of the current block
         return
     
     def show(self, tstat = True):
@@ -55,23 +59,16 @@ class statistic:
          '22.4%': 22.4% (224 games) terminated with 8192-tiles (the largest)
         """
         blk = min(len(self.data), self.block)
-        stat = [0] * 64
-        sop, pop, eop = 0, 0, 0
-        sdu, pdu, edu = 0, 0, 0
-        ssc, msc = 0, 0
-        for i in range(1, blk + 1):
-            ep = self.data[-i]
-            ssc += ep.score()
-            msc = max(ep.score(), msc)
-            stat[max(ep.state().state)] += 1
-            sop += ep.step()
-            pop += ep.step(action.slide.type)
-            eop += ep.step(action.place.type)
-            sdu += ep.time()
-            pdu += ep.time(action.slide.type)
-            edu += ep.time(action.place.type)
+        if self.accu[0] == blk: # the running aggregates cover exactly the last 'block' games
+            aggr = self.accu
+        else:
+            aggr = self.accumulator()
+            for i in range(1, blk + 1):
+                self.accumulate(aggr, self.data[-i])
+        n, ssc, msc, sop, pop, eop, sdu, pdu, edu, stat = aggr
         
-        print("%d\t" "avg = %d, max = %d, ops = %d (%d|%d)" % (self.count, ssc / blk, msc, sop * 1000 / sdu, pop * 1000 / pdu, eop * 1000 / edu))
+        ops = lambda n, du: n * 1000 / du if du else 0 # zero if the time usages are not recorded
+        print("%d\t" "avg = %d, max = %d, ops = %d (%d|%d)" % (self.count, ssc / blk, msc, ops(sop, sdu), ops(pop, pdu), ops(eop, edu)))
         
         if not tstat:
             return
@@ -88,6 +85,25 @@ class statistic:
         print()
         return
     
+    def accumulator(self):
+        """ [episodes, sum of score, max score, steps (all|player|env), time usages (all|player|env), max tile counts] """
+        return [0, 0, 0, 0, 0, 0, 0, 0, 0, [0] * 64]
+    
+    def accumulate(self, accu, ep):
+        """ add the aggregates of an episode to an accumulator """
+        score = ep.score()
+        accu[0] += 1
+        accu[1] += score
+        accu[2] = max(score, accu[2])
+        accu[3] += ep.step()
+        accu[4] += ep.step(action.slide.type)
+        accu[5] += ep.step(action.place.type)
+        accu[6] += ep.time()
+        accu[7] += ep.time(action.slide.type)
+        accu[8] += ep.time(action.place.type)
+        accu[9][max(ep.state().state)] += 1
+        return
+    
     def summary(self):
         block = self.block
         self.block = len(self.data)
@@ -100,16 +116,49 @@ class statistic:
     
     def open_episode(self, flag = ""):
         if self.count >= self.limit:
-            self.data = self.data[1:]
+            self.data.popleft()
         self.count += 1
-        self.data += [episode()]
+        self.data.append(episode())
         self.data[-1].open_episode(flag)
         return
     
     def close_episode(self, flag = ""):
         self.data[-1].close_episode(flag)
+        self.accumulate(self.accu, self.data[-1])
+        if self.count % self.block == 0:
+            self.show()
+            self.accu = self.accumulator()
+            if instrument.enabled:
+                instrument.report()
+                instrument.reset()
+        return
+    
+    def record(self, ep):
+        """ add an episode finished elsewhere, e.g., by a self-play worker process """
+        if self.count >= self.limit:
+            self.data.popleft()
+        self.count += 1
+        self.data.append(ep)
+        self.accumulate(self.accu, ep)
         if self.count % self.block == 0:
             self.show()
+            self.accu = self.accumulator()
+            if instrument.enabled:
+                instrument.report()
+                instrument.reset()
+        return
+    
+    def merge(self, other):
+        """
+        append the episodes of another statistic, e.g., of the next shard of a run
+        the merged statistic is the same as the one of a serial run over both, subject to the limit of saving records
+        """
+        self.data.extend(other.data)
+        while len(self.data) > self.limit:
+            self.data.popleft()
+        self.count += other.count
+        self.total = max(self.total, self.count)
+        self.accu = self.accumulator() # the running aggregates no longer match the last block
         return
     
     def at(self, i):
@@ -128,18 +177,34 @@ class statistic:
     
     def load(self, input):
         """ deserialize from a file object """
-        self.data = []
+        self.data = deque()
+        self.accu = self.accumulator()
         while True:
             # load an episode
             ep = episode()
             if ep.load(input):
-                self.data += [ep]
+                self.data.append(ep)
             else:
                 break
         self.total = max(self.total, len(self.data))
         self.count = len(self.data)
         return True
     
+    def save_binary(self, output):
+        """ serialize the episodes to a binary file object, see binlog """
+        log = binlog.writer(output)
+        for ep in self.data:
+            log.write(ep)
+        return True
+    
+    def load_binary(self, input):
+        """ deserialize from a binary file object, see binlog """
+        self.data = deque(binlog.reader(input))
+        self.accu = self.accumulator()
+        self.total = max(self.total, len(self.data))
+        self.count = len(self.data)
+        return True
+    
     def __str__(self):
         return "\n".join([str(ep) for ep in self.data]) + "\n"
     
@@ -11,13 +11,88 @@ Author: Hung Guei (moporgic)
 from board import board
 from action import action
 from episode import episode
+from bitboard import bitboard
 from statistic import statistic
 from agent import player
+from agent import search_player
 from agent import rndenv
 from agent import weight_agent
+import instrument
+import multiprocessing
+import queue
 import sys
 
 
+def play_episode(game, play, evil, weight, index = None):
+    """
+    play an opened episode until the player cannot move, return the winner
+    the agents use the random streams of the episode index if it is given
+    """
+    if index is not None:
+        play.reseed(index)
+        evil.reseed(index)
+    evil.reset()
+    for _ in range(9):
+        game.ep_time = game.nanosec()
+        game.apply_action(evil.take_action(game.state()))
+    while True:
+        #who = game.take_turns(play, evil)
+        if game.state().is_terminal(): # no legal move, the player is not asked
+            break
+        game.ep_time = game.nanosec()
+        if not game.apply_action(play.take_action(game.state(),weight,evil.bag)) :#or who.check_for_win(game.state()):
+            break
+        cstate = board(game.state())
+        game.ep_time = game.nanosec()
+        game.apply_action(evil.take_action(game.state()))
+        play.learning(cstate, game.state(), weight)
+    win = game.last_turns(play, evil)
+    play.close_episode(win.name(), weight)
+    return win
+
+def make_player(options):
+    """ the expectimax player is used if a search depth is given """
+    return search_player(options) if "depth=" in options else player(options)
+
+def self_play(index, layout, tables, counter, total, offset, results, play_args, evil_args):
+    """
+    self-play worker process, the TD updates are written into the shared weight tables without locking
+    the episodes are indexed from offset + 1, i.e., the first episode of the shard
+    the finished episodes are sent back through the results queue as (index within the shard, episode), followed by None
+    """
+    try:
+        options = " ".join([opt for opt in play_args.split() if opt.split("=")[0] not in ["load", "save"]])
+        play, evil, weight = make_player(options), rndenv(evil_args), weight_agent(options)
+        weight.set_tuples(*layout) # the layout of the loaded weights may differ from the options
+        weight.attach(tables)
+        while True:
+            with counter.get_lock():
+                if counter.value >= total:
+                    break
+                counter.value += 1
+                count = counter.value
+            game = episode()
+            game.open_episode(play.name() + ":" + evil.name())
+            win = play_episode(game, play, evil, weight, offset + count)
+            game.close_episode(win.name())
+            results.put((count, game))
+        weight.detach()
+    finally:
+        results.put(None) # the parent must not wait for a failed worker
+    return
+
+def load_log(path, stat):
+    """ load the episodes of a text or binary (.bin) episode log """
+    if path.endswith(".bin"): # binary episode log
+        input = open(path, "rb")
+        stat.load_binary(input)
+    else:
+        input = open(path, "r")
+        stat.load(input)
+    input.close()
+    return stat
+
+
 if __name__ == '__main__':
     print('threes Demo: ' + " ".join(sys.argv))
     print()
@@ -26,6 +101,8 @@ if __name__ == '__main__':
     play_args, evil_args = "", ""
     load, save = "", ""
     summary = False
+    batch, workers = 0, 0
+    shards, shard, merge = 1, 0, []
     for para in sys.argv[1:]:
         if "--total=" in para:
             total = int(para[(para.index("=") + 1):])
@@ -43,35 +120,84 @@ if __name__ == '__main__':
             save = para[(para.index("=") + 1):]
         elif "--summary" in para:
             summary = True
+        elif "--bitboard" in para:
+            episode.board = bitboard
+        elif "--batch=" in para:
+            batch = int(para[(para.index("=") + 1):])
+        elif "--workers=" in para:
+            workers = int(para[(para.index("=") + 1):])
+        elif "--profile" in para:
+            instrument.enable()
+        elif "--shards=" in para:
+            shards = int(para[(para.index("=") + 1):])
+        elif "--shard=" in para:
+            shard = int(para[(para.index("=") + 1):])
+        elif "--merge=" in para:
+            merge = para[(para.index("=") + 1):].split(",")
+    
+    if not 0 <= shard < shards:
+        print('--shard=' + str(shard) + ' is out of the range of --shards=' + str(shards))
+        sys.exit(1)
+    
+    # the shard plays the episodes offset + 1, ..., offset + total of the whole run
+    offset = total * shard // shards
+    total = total * (shard + 1) // shards - offset
     
     stat = statistic(total, block, limit)
     
     if load:
-        input = open(load, "r")
-        stat.load(input)
-        input.close()
+        load_log(load, stat)
         summary |= stat.is_finished()
     
-    with player(play_args) as play, rndenv(evil_args) as evil, weight_agent(play_args) as weight:
+    if merge: # combine the logs of the shards, in the order given
+        logs = [load_log(path, statistic(0)) for path in merge]
+        stat = statistic(sum([log.count for log in logs]), block, limit)
+        for log in logs:
+            stat.merge(log)
+        summary = True
+    
+    with make_player(play_args) as play, rndenv(evil_args) as evil, weight_agent(play_args) as weight:
+        weight.resume(stat, play, evil) # restore the weights, the seeds, and the statistic of the last checkpoint
+        if batch:
+            from batch import batch as lockstep # requires numpy
+            seed = evil.property("seed")
+            lockstep(batch, weight, int(seed) if seed is not None else None, offset).run(stat, play, evil)
+        if workers:
+            tables = weight.share()
+            counter, results = multiprocessing.Value('l', stat.count), multiprocessing.Queue()
+            layout = weight.tuple_list, weight.table
+            procs = [multiprocessing.Process(target = self_play, args = (i, layout, tables, counter, stat.total, offset, results, play_args, evil_args)) for i in range(workers)]
+            for proc in procs:
+                proc.start()
+            running, pending = workers, {}
+            while running:
+                try:
+                    result = results.get(timeout = 1)
+                except queue.Empty:
+                    if not any([proc.is_alive() for proc in procs]): # killed before sending None
+                        break
+                    continue
+                if result is None:
+                    running -= 1
+                    continue
+                pending[result[0]] = result[1]
+                while stat.count + 1 in pending: # record in the order of the episode index, as a serial run does
+                    stat.record(pending.pop(stat.count + 1))
+                    weight.snapshot(stat, play, evil)
+            for proc in procs:
+                proc.join()
+            weight.detach(unlink = True)
+            failed = [str(i) for i, proc in enumerate(procs) if proc.exitcode]
+            if failed:
+                raise RuntimeError('self-play worker ' + ", ".join(failed) + ' failed')
         while not stat.is_finished():
             #play.open_episode("~:" + evil.name())
             #evil.open_episode(play.name() + ":~")
             stat.open_episode(play.name() + ":" + evil.name())
             game = stat.back()
-            evil.reset()
-            for _ in range(9):
-                game.apply_action(evil.take_action(game.state()))
-            while True:
-                #who = game.take_turns(play, evil)
-                game.ep_time = game.millisec()
-                if not game.apply_action(play.take_action(game.state(),weight)) :#or who.check_for_win(game.state()):
-                    break
-                cstate = board(game.state())
-                game.ep_time = game.millisec()
-                game.apply_action(evil.take_action(game.state()))
-                play.learning(cstate, game.state(), weight)
-            win = game.last_turns(play, evil)
+            win = play_episode(game, play, evil, weight, offset + stat.count)
             stat.close_episode(win.name())
+            weight.snapshot(stat, play, evil)
             #break
             #play.close_episode(win.name())
             #evil.close_episode(win.name())
@@ -79,6 +205,10 @@ if __name__ == '__main__':
         stat.summary()
     
     if save:
-        output = open(save, "w")
-        stat.save(output)
+        if save.endswith(".bin"): # binary episode log
+            output = open(save, "wb")
+            stat.save_binary(output)
+        else:
+            output = open(save, "w")
+            stat.save(output)
         output.close()
\ No newline at end of file
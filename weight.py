@@ -9,12 +9,14 @@ Author: Hung Guei (moporgic)
 """
 
 from array import array
+from multiprocessing import shared_memory
 
 
 class weight:
+    """ weight table backed by a contiguous float32 buffer """
     
     def __init__(self, len = 0):
-        self.value = [0] * len
+        self.value = array('f', bytes(4 * len))
         return
     
     def __getitem__(self, index):
@@ -27,10 +29,23 @@ class weight:
     def __len__(self):
         return len(self.value)
     
+    def touched(self):
+        """ the fraction of the nonzero weights """
+        value = self.value if isinstance(self.value, array) else array('f', self.value.tobytes())
+        return 1 - value.count(0) / len(value) if len(value) else 0
+    
+    def resident(self):
+        """ the bytes of the table """
+        return 4 * len(self.value)
+    
+    def dense(self):
+        """ a contiguous float32 weight table with the same values """
+        return self
+    
     def save(self, output):
         """ serialize this weight to a file object """
         array('Q', [len(self.value)]).tofile(output)
-        array('f', self.value).tofile(output)
+        output.write(self.value)
         return True
     
     def load(self, input):
@@ -40,6 +55,31 @@ class weight:
         size = size[0]
         value = array('f')
         value.fromfile(input, size)
-        self.value = list(value)
+        self.value = value
         return True
+    
+    def share(self):
+        """ move this weight into a shared memory block, return the name of the block """
+        self.shm = shared_memory.SharedMemory(create = True, size = max(4 * len(self.value), 1))
+        self.shm.buf[:4 * len(self.value)] = self.value.tobytes()
+        self.value = self.shm.buf[:4 * len(self.value)].cast('f')
+        return self.shm.name
+    
+    def attach(self, name, size):
+        """ use the shared memory block created by another process """
+        self.shm = shared_memory.SharedMemory(name = name)
+        self.value = self.shm.buf[:4 * size].cast('f')
+        return
+    
+    def detach(self, unlink = False):
+        """ copy the shared values back to a private buffer and release the shared memory block """
+        value = array('f')
+        value.frombytes(self.value.tobytes())
+        self.value.release()
+        self.value = value
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+        self.shm = None
+        return
     
\ No newline at end of file
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""
+Basic framework for developing 2048 programs in Python
+
+Author: Hung Guei (moporgic)
+        Computer Games and Intelligence (CGI) Lab, NCTU, Taiwan
+        http://www.aigames.nctu.edu.tw
+"""
+
+from weight import weight
+from array import array
+import struct
+import mmap
+import zlib
+import sys
+import os
+
+# versioned weight file, all fields are little-endian
+# header: magic 'NTWF', version, number of tables, number of tuples
+# tuples: for each tuple, its table, its length, and its positions (one byte each)
+# tables: for each table, the offset (page-aligned) and the number of float32 entries, and the crc32 of the entries
+# the crc32 of all the above follows, then the tables at their offsets
+magic, version = b'NTWF', 1
+header = struct.Struct('<4sIII')
+directory = struct.Struct('<QQI')
+page = mmap.PAGESIZE
+
+
+def is_weightfile(path):
+    with open(path, 'rb') as input:
+        return input.read(len(magic)) == magic
+
+def save(path, net, tuple_list, table):
+    """
+    save the weight tables with their tuple layout
+    the file is written aside and then renamed, since the tables may be mapped from the file being replaced
+    """
+    meta = bytearray(header.pack(magic, version, len(net), len(tuple_list)))
+    for tup, t in zip(tuple_list, table):
+        meta += struct.pack('<BB', t, len(tup)) + bytes(tup)
+    values = [little_endian(w.dense().value) for w in net] # float32 entries as in the file, e.g., dequantized from int16
+    offset = align(len(meta) + directory.size * len(net) + 4)
+    for value in values:
+        meta += directory.pack(offset, len(value), zlib.crc32(value))
+        offset = align(offset + 4 * len(value))
+    meta += struct.pack('<I', zlib.crc32(meta))
+    with open(path + ".tmp", 'wb') as output:
+        output.write(meta)
+        for value in values:
+            output.write(bytes(align(output.tell()) - output.tell()))
+            output.write(value)
+    os.replace(path + ".tmp", path)
+    return True
+
+def load(path, writable = True):
+    """
+    map the weight file into memory, return (net, tuple_list, table)
+    the tables are shared through the page cache, they are read-only unless writable (copy-on-write)
+    """
+    with open(path, 'rb') as input:
+        mm = mmap.mmap(input.fileno(), 0, access = mmap.ACCESS_COPY if writable else mmap.ACCESS_READ)
+    buf = memoryview(mm)
+    tag, ver, ntable, ntuple = header.unpack_from(buf, 0)
+    if tag != magic or ver != version:
+        raise ValueError(path + ': not a weight file of version ' + str(version))
+    pos, tuple_list, table = header.size, [], []
+    for _ in range(ntuple):
+        t, size = struct.unpack_from('<BB', buf, pos)
+        tuple_list += [list(buf[pos + 2:pos + 2 + size])]
+        table += [t]
+        pos += 2 + size
+    entries = [directory.unpack_from(buf, pos + i * directory.size) for i in range(ntable)]
+    pos += ntable * directory.size
+    if struct.unpack_from('<I', buf, pos)[0] != zlib.crc32(buf[:pos]):
+        raise ValueError(path + ': corrupted header')
+    net = []
+    for offset, size, crc in entries:
+        data = buf[offset:offset + 4 * size]
+        if zlib.crc32(data) != crc:
+            raise ValueError(path + ': corrupted table at ' + str(offset))
+        w = weight()
+        if sys.byteorder == 'little':
+            w.value = data.cast('f')
+        else:
+            w.value = array('f', data.tobytes())
+            w.value.byteswap()
+        net += [w]
+    return net, tuple_list, table
+
+def align(offset):
+    return (offset + page - 1) // page * page
+
+def little_endian(value):
+    if sys.byteorder == 'little':
+        return value
+    value = array('f', value)
+    value.byteswap()
+    return value
+
+
+if __name__ == '__main__':
+    # convert a weight file of the previous format (a native 'L' count, then 'Q' size and 'f' data per table)
+    # the tuple layout is given by the weight_agent options, e.g., "isomorphic"
+    if len(sys.argv) < 3:
+        print('usage: python3 weightfile.py old.bin new.bin ["options of weight_agent"]')
+        sys.exit(1)
+    from agent import weight_agent
+    agent = weight_agent(sys.argv[3] if len(sys.argv) > 3 else "")
+    agent.net = []
+    agent.load_weights(sys.argv[1])
+    save(sys.argv[2], agent.net, agent.tuple_list, agent.table)
+    print('converted ' + sys.argv[1] + ' to ' + sys.argv[2] + ' (' + str(len(agent.net)) + ' tables)')